@@ -6,10 +6,59 @@ Created on Wed Nov 8 00:40:06 2023
 @author: Chidex
 """
 
+import hashlib
+import os
+
 import numpy as np
 import pandas as pd
+import matplotlib
+# Render straight to file without starting a GUI event loop
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
+import matplotlib.colors as mcolors
+import matplotlib.dates as mdates
+
+
+# The figure and axes shared by the plotting helpers, created on first use
+_FIG = None
+_AX = None
+
+
+def _get_figure(figsize):
+    """
+    Returns the shared figure and axes, cleared and resized for a new plot
+
+    Parameters
+    ----------
+    figsize : tuple
+        The width and height of the figure in inches
+
+    Returns
+    -------
+    The figure and its axes.
+
+    """
+    global _FIG, _AX
+
+    if _FIG is None:
+        _FIG, _AX = plt.subplots(figsize=figsize)
+        return _FIG, _AX
+
+    # Clearing the axes is cheaper than building a new figure and axes.
+    # clear() keeps the frame, aspect and tick label rotation, which the
+    # pie chart and the rotated x ticks change, so reset those as well
+    _AX.clear()
+    _AX.set_frame_on(True)
+    _AX.set_aspect("auto")
+    _AX.tick_params(axis="both", labelrotation=0)
+    _FIG.set_size_inches(figsize)
+
+    # Undo the margins set by tight_layout for the previous plot
+    _FIG.subplots_adjust(**{
+        name: plt.rcParams["figure.subplot." + name]
+        for name in ("left", "bottom", "right", "top", "wspace", "hspace")})
+
+    return _FIG, _AX
 
 
 def plot_line_graph(data, title, xlabel, ylabel):
@@ -32,22 +81,31 @@ def plot_line_graph(data, title, xlabel, ylabel):
     None.
 
     """
-    plt.figure(figsize=(10, 10))
+    fig, ax = _get_figure(figsize=(10, 10))
+
+    # This will plot all the columns in the dataframe using the index as
+    # the x-axis. Plotting the arrays directly skips the pandas time series
+    # formatter, which is slow as it converts every tick to a string
+    dates = data.index.to_numpy()
+    ax.plot(dates, data.to_numpy())
 
-    # This will plot all the numeric columns in the
-    # dataframe using the index as the x-axis
-    data.plot()
+    # Only label the handful of ticks picked by the locator
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
 
-    plt.title(title, fontweight="bold")
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.xticks(rotation=45)
-    plt.xlim(data.index.min(), data.index.max())
-    plt.legend()
+    ax.set_title(title, fontweight="bold")
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis="x", rotation=45)
+    ax.set_xlim(dates.min(), dates.max())
+    ax.legend(data.columns)
 
-    plt.savefig("line_plot.png", bbox_inches="tight")
+    # Fit the layout once here rather than measuring it again when saving
+    # with bbox_inches="tight"
+    fig.tight_layout()
 
-    plt.show()
+    fig.savefig("line_plot.png", dpi=100)
 
 
 def plot_pie_chart(data, title):
@@ -66,27 +124,27 @@ def plot_pie_chart(data, title):
     None.
 
     """
-    plt.figure()
+    fig, ax = _get_figure(figsize=plt.rcParams["figure.figsize"])
 
     # Plot the chart as a percentage
-    patches, texts, pcts = plt.pie(data, labels=data.index, autopct='%.1f%%',
-                                   wedgeprops={'linewidth': 3.0,
-                                               'edgecolor': 'white'},
-                                   textprops={'fontweight': 600})
+    patches, texts, pcts = ax.pie(data, labels=data.index, autopct='%.1f%%',
+                                  wedgeprops={'linewidth': 3.0,
+                                              'edgecolor': 'white'},
+                                  textprops={'fontweight': 600})
 
     # Set the colour of the label of each wedge to the wedge colour
-    for i, patch in enumerate(patches):
-        texts[i].set_color(patch.get_facecolor())
+    colours = [patch.get_facecolor() for patch in patches]
+    for text, colour in zip(texts, colours):
+        text.set_color(colour)
 
     # Set the color of the percent values inside the pie to white
-    plt.setp(pcts, color='white')
-
-    plt.title(title, fontweight="bold")
-    plt.tight_layout()
+    for pct in pcts:
+        pct.set_color('white')
 
-    plt.savefig("piechart.png")
+    ax.set_title(title, fontweight="bold")
+    fig.tight_layout()
 
-    plt.show()
+    fig.savefig("piechart.png")
 
 
 def plot_bar_chart(data, title, xlabel, ylabel):
@@ -109,23 +167,21 @@ def plot_bar_chart(data, title, xlabel, ylabel):
     None.
 
     """
-    plt.figure(figsize=(10, 10))
+    fig, ax = _get_figure(figsize=(10, 10))
 
-    data.plot(kind="bar")
+    data.plot(kind="bar", ax=ax)
 
-    plt.title(title, fontweight="bold")
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.legend(bbox_to_anchor=(1.25, 0.6), loc='center right')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    ax.set_title(title, fontweight="bold")
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.legend(bbox_to_anchor=(1.25, 0.6), loc='center right')
+    ax.tick_params(axis="x", rotation=45)
+    fig.tight_layout()
 
-    plt.savefig("barchart.png")
+    fig.savefig("barchart.png", dpi=100)
 
-    plt.show()
 
-
-def plot_bubble_plot(x, y, col, title, xlabel, ylabel, legend_handles):
+def plot_bubble_plot(x, y, col, title, xlabel, ylabel, colors, labels):
     """
     Plots a bubble plot with the given data
 
@@ -136,145 +192,222 @@ def plot_bubble_plot(x, y, col, title, xlabel, ylabel, legend_handles):
     y : Series
         The y coordinates of the data points.
     col : Series
-        The sequence of colors for setting the colour of each points.
+        The category code of each point, used to pick its colour.
     title : str
         The title of the plot.
     xlabel: str
         The label of the X axis
     ylabel: str
         The label of the Y axis
-    legend_handles : sequence
-        Color box for creating the legend.
+    colors : sequence
+        The colour of each category code.
+    labels : sequence
+        The legend label of each category code.
 
     Returns
     -------
     None.
 
     """
-    plt.figure(figsize=(10, 10))
-
-    plt.scatter(x, y, c=col, s=200, alpha=0.5)
-
-    plt.title(title, fontweight="bold")
-    plt.xlim(x.min(), x.max())
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.grid()
-
-    # Create a custom legend
-    plt.legend(handles=legend_handles,
-               loc="upper center", framealpha=0.2)
+    fig, ax = _get_figure(figsize=(10, 10))
+
+    # Map each category code to its colour through a colormap, so the
+    # colours stay in one collection however many categories there are
+    cmap = mcolors.ListedColormap(colors)
+    norm = mcolors.BoundaryNorm(np.arange(len(colors) + 1) - 0.5, len(colors))
+    bubbles = ax.scatter(x, y, c=col, cmap=cmap, norm=norm, s=200, alpha=0.5)
+
+    # Draw all the bubbles as one image when saving
+    bubbles.set_rasterized(True)
+
+    ax.set_title(title, fontweight="bold")
+    # Work out the limits with numpy once instead of two pandas reductions
+    xv = np.asarray(x)
+    ax.set_xlim(float(xv.min()), float(xv.max()))
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.grid()
+
+    # Create the legend from the colours used by the bubbles. num=None gives
+    # one handle for each code present, however many there are, so only use
+    # the labels of those codes
+    handles, _ = bubbles.legend_elements(num=None)
+    ax.legend(handles, [labels[code] for code in np.unique(col)],
+              loc="upper center", framealpha=0.2)
 
     # Save the plot
-    plt.savefig("bubble-plot.png")
-
-    plt.show()
+    fig.savefig("bubble-plot.png")
 
 
-def clean_outliers(column_data):
+def load_cached(url, cache_path, **kwargs):
     '''
-    Checks the column for outliers and sets them to a suitable value
+    Reads a CSV file from the given url, keeping a local parquet copy so that
+    later runs do not have to download it again
 
     Parameters
     ----------
-    column_data : Series
-        The series to check for outliers .
+    url : str
+        The url of the CSV file.
+    cache_path : str
+        The path of the parquet file used as the local copy. A short hash
+        of the read options is added to the file name, so a copy read
+        with different options is never reused.
+    **kwargs
+        Extra arguments passed to pd.read_csv, such as usecols and dtype.
 
     Returns
     -------
-    The series with the outliers set to either the upper or lower limit.
+    The data as a DataFrame.
 
     '''
-    q3, q1 = np.quantile(column_data, [0.75, 0.25])
-    iqr = q3 - q1
-    lower_limit = q1 - 1.5*iqr
-    upper_limit = q3 + 1.5*iqr
-
-    # Set outliers above the upper limit to the upper limit
-    column_data[column_data >= upper_limit] = upper_limit
-
-    # Set outliers below the lower limit to the lower limit
-    column_data[column_data <= lower_limit] = lower_limit
+    options = hashlib.md5(repr(sorted(kwargs.items())).encode()).hexdigest()
+    root, ext = os.path.splitext(cache_path)
+    cache_path = f"{root}-{options[:8]}{ext}"
 
-    return column_data
-
-
-""" 
-    import and visualise data on museum visitors
-"""
+    if os.path.exists(cache_path):
+        return pd.read_parquet(cache_path)
 
-museum_visitors = pd.read_csv('https://data.lacity.org/resource/trxm-jn3c.csv')
+    df = pd.read_csv(url, **kwargs)
 
-# Select the columns we want to work with
-museum_visitors = museum_visitors.loc[:, [
-    "month", "avila_adobe", "firehouse_museum", "america_tropical_interpretive_center", "chinese_american_museum"]]
-museum_visitors.fillna(method="ffill", inplace=True)
+    directory = os.path.dirname(cache_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
 
-# Rename the columns
-museum_visitors.rename(columns={"month": "Date", "avila_adobe": "Avila Adobe", "firehouse_museum": "Firehouse Museum",
-                                "america_tropical_interpretive_center": "America Tropical center",
-                                "chinese_american_museum": "Chinese American Museum"}, inplace=True)
+    # Write to a temporary file first, so an interrupted write never leaves
+    # a partial copy behind for later runs to load
+    tmp_path = cache_path + ".tmp"
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, cache_path)
 
-# Convert the Date column to a datetime tipe
-museum_visitors['Date'] = museum_visitors['Date'].str.split('T').str[0]
-museum_visitors['Date'] = pd.to_datetime(
-    museum_visitors['Date'], format='%Y-%m-%d')
+    return df
 
-# Set the date column as the index of the data
-museum_visitors.set_index('Date', inplace=True)
 
-""" Draw a line plot of the data """
-plot_line_graph(museum_visitors,
-                title="Visitors to Different El Pueblo Museums",
-                xlabel="Year",
-                ylabel="Number of visitors")
-
-
-# Get the sum of visitors in 2017 for each museum
-museum_visitors_2017 = museum_visitors.loc["2017-01-01": "2017-12-01"].sum(
-    axis=0)
+def clean_outliers(data):
+    '''
+    Checks each column for outliers and sets them to a suitable value
 
-""" Plot a pie chart of the percange of visitors that visited each museum """
-plot_pie_chart(museum_visitors_2017,
-               'El Pueblo Museums Monthly Visitors in 2017')
+    Parameters
+    ----------
+    data : Series or DataFrame
+        The series, or the columns of the data frame, to check for outliers.
 
-# Plot a bar chart of the visitors that visited each museum yearly
-yearly_museum_visitors = museum_visitors.resample('Y').sum()
-yearly_museum_visitors.index = yearly_museum_visitors.index.year
+    Returns
+    -------
+    A copy of the data with the outliers set to either the upper or lower
+    limit of their column.
 
-""" Plot a bar chart of the yearly museum visitors """
-plot_bar_chart(yearly_museum_visitors,
-               title="Yearly Number of El Pueblo Museum Visitors",
-               xlabel="Years", ylabel="Number of Visitors")
+    '''
+    # Work on a float copy so the clipping can be done in place
+    values = np.array(data, dtype=np.float64)
 
+    # The limits of every column are computed together along the rows
+    q1, q3 = np.quantile(values, [0.25, 0.75], axis=0, method="linear")
+    iqr = q3 - q1
+    lower_limit = q1 - 1.5*iqr
+    upper_limit = q3 + 1.5*iqr
 
-"""
-    Import and visualise data on pdp of countries
-"""
+    # Set outliers outside the limits to the nearest limit in a single pass
+    np.clip(values, lower_limit, upper_limit, out=values)
 
-gdp_data = pd.read_csv(
-    'https://vincentarelbundock.github.io/Rdatasets/csv/AER/GrowthDJ.csv')
+    if isinstance(data, pd.DataFrame):
+        return pd.DataFrame(values, index=data.index, columns=data.columns)
 
-# Select the columns to use
-gdp_data = gdp_data.loc[:, ["oecd", "gdp60", "gdp85"]]
+    return pd.Series(values, index=data.index, name=data.name)
 
-# Drop countries with missing data
-gdp_data.dropna(inplace=True)
 
-# Set outliers to appropraite values
-cleaned_gdp85_gdp60 = gdp_data[["gdp85", "gdp60"]].apply(clean_outliers)
-gdp_data["gdp85"] = cleaned_gdp85_gdp60["gdp85"]
-gdp_data["gdp60"] = cleaned_gdp85_gdp60["gdp60"]
+def main():
+    """
+    Downloads the museum visitors and GDP data, cleans them and saves the
+    plots
 
-# Create color box to use for custom legend
-color = {"yes": "green", "no": "red"}
-oecd_patch = mpatches.Patch(color="green", label="OECD Country")
-non_oecd_patch = mpatches.Patch(color="red", label="NON OECD Country")
+    Returns
+    -------
+    None.
 
-""" Make the bubble plot """
-plot_bubble_plot(gdp_data["gdp60"], gdp_data["gdp85"],
-                 col=gdp_data["oecd"].map(color),
-                 title="Cross Country GDP",
-                 xlabel="Per capita GDP in 1960",
-                 ylabel="Per capita GDP in 1985",
-                 legend_handles=[oecd_patch, non_oecd_patch])
+    """
+    # Import and visualise data on museum visitors
+    museum_columns = ["month", "avila_adobe", "firehouse_museum",
+                      "america_tropical_interpretive_center", "chinese_american_museum"]
+
+    # Only read the columns we want to work with
+    museum_visitors = load_cached('https://data.lacity.org/resource/trxm-jn3c.csv',
+                                  os.path.join(".cache", "museum_visitors.parquet"),
+                                  usecols=museum_columns,
+                                  dtype={"avila_adobe": "float32",
+                                         "firehouse_museum": "float32",
+                                         "america_tropical_interpretive_center": "float32",
+                                         "chinese_american_museum": "float32"},
+                                  parse_dates=["month"])
+
+    # usecols keeps the order of the file, so put the columns back in our order
+    museum_visitors = museum_visitors[museum_columns]
+
+    # Fill missing values with the previous month, if there are any
+    if museum_visitors.isna().values.any():
+        museum_visitors = museum_visitors.ffill()
+
+    # Rename the columns
+    museum_visitors.rename(columns={"month": "Date", "avila_adobe": "Avila Adobe", "firehouse_museum": "Firehouse Museum",
+                                    "america_tropical_interpretive_center": "America Tropical center",
+                                    "chinese_american_museum": "Chinese American Museum"}, inplace=True)
+
+    # Set the date column as the index of the data
+    museum_visitors.set_index('Date', inplace=True)
+
+    # Draw a line plot of the data
+    plot_line_graph(museum_visitors,
+                    title="Visitors to Different El Pueblo Museums",
+                    xlabel="Year",
+                    ylabel="Number of visitors")
+
+    # Get the sum of visitors in 2017 for each museum
+    # Comparing the years is a plain integer comparison, and unlike a label
+    # slice it also works when the months are not sorted
+    in_2017 = museum_visitors.index.year == 2017
+    museum_visitors_2017 = museum_visitors.iloc[in_2017].sum(axis=0)
+
+    # Plot a pie chart of the percange of visitors that visited each museum
+    plot_pie_chart(museum_visitors_2017,
+                   'El Pueblo Museums Monthly Visitors in 2017')
+
+    # Plot a bar chart of the visitors that visited each museum yearly
+    yearly_museum_visitors = museum_visitors.select_dtypes(
+        'number').resample('YE').sum()
+    yearly_museum_visitors.index = yearly_museum_visitors.index.year.astype(
+        np.int16)
+
+    # Plot a bar chart of the yearly museum visitors
+    plot_bar_chart(yearly_museum_visitors,
+                   title="Yearly Number of El Pueblo Museum Visitors",
+                   xlabel="Years", ylabel="Number of Visitors")
+
+    # Import and visualise data on pdp of countries.
+    # Only read the columns to use. The categories of oecd are fixed so that
+    # its codes are always 0 for "no" and 1 for "yes"
+    gdp_data = load_cached(
+        'https://vincentarelbundock.github.io/Rdatasets/csv/AER/GrowthDJ.csv',
+        os.path.join(".cache", "gdp.parquet"),
+        usecols=["oecd", "gdp60", "gdp85"],
+        dtype={"oecd": pd.CategoricalDtype(["no", "yes"]),
+               "gdp60": "float32", "gdp85": "float32"})
+
+    # Drop countries with missing data
+    gdp_data.dropna(inplace=True)
+
+    # Set outliers to appropraite values
+    # and keep them as float32, which is all the precision the plot needs
+    gdp_data[["gdp85", "gdp60"]] = clean_outliers(
+        gdp_data[["gdp85", "gdp60"]]).astype(np.float32)
+
+    # Make the bubble plot
+    plot_bubble_plot(gdp_data["gdp60"], gdp_data["gdp85"],
+                     col=gdp_data["oecd"].cat.codes,
+                     title="Cross Country GDP",
+                     xlabel="Per capita GDP in 1960",
+                     ylabel="Per capita GDP in 1985",
+                     colors=["red", "green"],
+                     labels=["NON OECD Country", "OECD Country"])
+
+
+if __name__ == "__main__":
+    main()